@@ -1,9 +1,11 @@
 import streamlit as st
+import asyncio
+import hashlib
 import json
 import os
-import csv
+import threading
+from dataclasses import dataclass, field
 from datetime import datetime
-from openai import OpenAI
 
 # Page configuration - MUST be first Streamlit command
 st.set_page_config(
@@ -13,8 +15,8 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Custom CSS for mobile-first design
-st.markdown("""
+# Custom CSS for mobile-first design, built once at import time
+_CSS = """
 <style>
     /* Mobile-first styling */
     .stApp {
@@ -156,31 +158,135 @@ st.markdown("""
         box-shadow: 0 0 0 2px rgba(0, 102, 204, 0.1) !important;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+@st.cache_resource
+def inject_css():
+    """Inject the stylesheet once; Streamlit replays the cached element on reruns."""
+    st.markdown(_CSS, unsafe_allow_html=True)
+
+
+inject_css()
+
+
+@dataclass(slots=True, frozen=True)
+class CaseData:
+    """One OSCE case, with safe defaults for any keys missing from the JSON."""
+    case_id: str
+    patient_name: str = "Unknown"
+    age: int | str = "Unknown"
+    gender: str = "Unknown"
+    chief_complaint: str = "Not specified"
+    presenting_history: str = "Not provided"
+    past_medical_history: tuple = ()
+    pmh_joined: str = "Not provided"
+    social_history: str = "Not provided"
+    allergies: str = "No known allergies"
+    script_instructions: str = "Act as a cooperative patient."
+    secret_info: str = "None"
+    singlish_level: str = "low"
+    vitals: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, raw, fallback_id):
+        """Build a case from a parsed JSON dict, applying defaults once."""
+        pmh = raw.get("past_medical_history") or ["Not provided"]
+        return cls(
+            case_id=raw.get("case_id", fallback_id),
+            patient_name=raw.get("patient_name", "Unknown"),
+            age=raw.get("age", "Unknown"),
+            gender=raw.get("gender", "Unknown"),
+            chief_complaint=raw.get("chief_complaint", "Not specified"),
+            presenting_history=raw.get("presenting_history", "Not provided"),
+            past_medical_history=tuple(pmh),
+            pmh_joined="\n".join(pmh),
+            social_history=raw.get("social_history", "Not provided"),
+            allergies=raw.get("allergies", "No known allergies"),
+            script_instructions=raw.get("script_instructions", "Act as a cooperative patient."),
+            secret_info=raw.get("secret_info", "None"),
+            singlish_level=raw.get("singlish_level", "low"),
+            vitals=raw.get("vitals", {}),
+        )
+
 
+def get_cases_signature():
+    """Cheap signature of the cases directory, used as a cache key.
 
-def load_cases():
-    """Load all case files from the cases directory."""
+    Changes whenever a case file is added, removed or modified, so the
+    cached load_cases() result is invalidated exactly when needed.
+    """
+    cases_dir = "cases"
+    if not os.path.exists(cases_dir):
+        return ()
+    with os.scandir(cases_dir) as entries:
+        return tuple(sorted(
+            (entry.name, entry.stat().st_mtime)
+            for entry in entries
+            if entry.name.endswith(".json")
+        ))
+
+
+@st.cache_resource
+def get_case_cache():
+    """Per-file parse cache: path -> (mtime, CaseData).
+
+    Held in a cached resource because module globals are re-initialized
+    on every rerun; this way unchanged files skip re-parsing even when
+    the directory signature forces a reload.
+    """
+    return {}
+
+
+@st.cache_data(ttl=3600)
+def load_cases(signature):
+    """Load all case files from the cases directory.
+
+    Cached across reruns; `signature` (from get_cases_signature) keys the
+    cache so cases are only re-read from disk when a file changes.
+    """
     cases = {}
     cases_dir = "cases"
-    
-    if os.path.exists(cases_dir):
-        for filename in os.listdir(cases_dir):
-            if filename.endswith(".json"):
-                filepath = os.path.join(cases_dir, filename)
-                try:
-                    with open(filepath, "r") as f:
-                        case_data = json.load(f)
-                        case_id = case_data.get("case_id", filename.replace(".json", ""))
-                        cases[case_id] = case_data
-                except Exception as e:
-                    st.error(f"Error loading {filename}: {e}")
-    
+
+    if not os.path.exists(cases_dir):
+        return cases
+
+    case_cache = get_case_cache()
+    with os.scandir(cases_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+                cached = case_cache.get(entry.path)
+                if cached is not None and cached[0] == mtime:
+                    case_data = cached[1]
+                else:
+                    with open(entry.path, "r") as f:
+                        case_data = CaseData.from_dict(
+                            json.loads(f.read()), entry.name.replace(".json", ""))
+                    case_cache[entry.path] = (mtime, case_data)
+                cases[case_data.case_id] = case_data
+            except Exception as e:
+                st.error(f"Error loading {entry.name}: {e}")
+
     return cases
 
 
+@st.cache_data(ttl=3600)
+def get_case_labels(signature):
+    """Selectbox labels per case, cached alongside load_cases."""
+    return {
+        case_id: f"{data.patient_name} - {data.chief_complaint}"
+        for case_id, data in load_cases(signature).items()
+    }
+
+
+@st.cache_resource
 def ensure_feedback_csv():
-    """Create feedback.csv if it doesn't exist."""
+    """Create feedback.csv if it doesn't exist (checked once per process)."""
+    import csv
+
     feedback_file = "feedback.csv"
     if not os.path.exists(feedback_file):
         with open(feedback_file, "w", newline="") as f:
@@ -189,62 +295,116 @@ def ensure_feedback_csv():
     return feedback_file
 
 
-def save_feedback(feedback_text, rating):
-    """Save feedback to CSV file."""
+# Flush buffered feedback rows to disk once this many accumulate
+_FEEDBACK_FLUSH_THRESHOLD = 5
+
+
+def flush_feedback():
+    """Write any buffered feedback rows to disk in one append."""
+    buffer = st.session_state.get("_feedback_buffer")
+    if not buffer:
+        return
+
+    import csv
+
     feedback_file = ensure_feedback_csv()
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    with open(feedback_file, "a", newline="") as f:
+    with open(feedback_file, "a", newline="", buffering=8192) as f:
         writer = csv.writer(f)
-        writer.writerow([timestamp, feedback_text, rating])
+        writer.writerows(buffer)
+    buffer.clear()
+
+
+def save_feedback(feedback_text, rating):
+    """Queue feedback for writing; rows are flushed in batches."""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    buffer = st.session_state.setdefault("_feedback_buffer", [])
+    buffer.append([timestamp, feedback_text, rating])
+
+    if len(buffer) >= _FEEDBACK_FLUSH_THRESHOLD:
+        flush_feedback()
+
+
+# Language instructions per Singlish level, keyed by the case's "singlish_level"
+_SINGLISH_INSTRUCTIONS = {
+    "high": """Use heavy Singlish expressions naturally. Include common phrases like 'lah', 'leh', 'lor', 'sia', 'can or not', 'how come', 'aiyo', 'walao'.
+        Mix English with occasional Chinese/Malay words. Speak in a very casual, local Singaporean manner.""",
+    "moderate": """Use moderate Singlish. Include occasional 'lah', 'leh', 'lor' at the end of sentences.
+        Speak in a casual but understandable Singaporean English style. Don't overdo the slang.""",
+    "low": """Speak in standard English with minimal Singlish. You may occasionally use 'lah' or 'okay' in a Singaporean way,
+        but keep the language clear and professional.""",
+}
 
 
 def get_singlish_instruction(level):
     """Get language instruction based on Singlish level."""
-    if level == "high":
-        return """Use heavy Singlish expressions naturally. Include common phrases like 'lah', 'leh', 'lor', 'sia', 'can or not', 'how come', 'aiyo', 'walao'. 
-        Mix English with occasional Chinese/Malay words. Speak in a very casual, local Singaporean manner."""
-    elif level == "moderate":
-        return """Use moderate Singlish. Include occasional 'lah', 'leh', 'lor' at the end of sentences. 
-        Speak in a casual but understandable Singaporean English style. Don't overdo the slang."""
-    else:  # low or default
-        return """Speak in standard English with minimal Singlish. You may occasionally use 'lah' or 'okay' in a Singaporean way, 
-        but keep the language clear and professional."""
-
-
-def get_ai_response(messages, case_data):
-    """Get AI response from OpenAI."""
-    try:
-        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        
-        singlish_level = case_data.get("singlish_level", "low")
-        singlish_instruction = get_singlish_instruction(singlish_level)
-        
-        system_prompt = f"""You are a standardized patient in an OSCE (Objective Structured Clinical Examination) simulation for medical students.
+    return _SINGLISH_INSTRUCTIONS.get(level, _SINGLISH_INSTRUCTIONS["low"])
+
+
+@st.cache_resource
+def get_event_loop():
+    """Background asyncio loop the async OpenAI client runs on.
+
+    Streamlit scripts are synchronous, so coroutines are bridged onto
+    this long-lived loop with run_coroutine_threadsafe; asyncio.run per
+    call would tear down the loop (and the client's connection pool)
+    between calls.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+def run_async(coro):
+    """Run a coroutine on the shared background loop and return its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+@st.cache_resource
+def get_openai_client():
+    """Create the async OpenAI client once and reuse it across reruns.
+
+    Imported lazily: the openai SDK pulls in httpx and pydantic, which is
+    a noticeable chunk of cold-start time users on other pages never need.
+    """
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+
+@st.cache_data
+def build_system_prompt(case_id, case_data):
+    """Build the standardized-patient system prompt for a case.
+
+    Cached per case_id so the prompt string is assembled once per case,
+    not on every chat turn.
+    """
+    singlish_instruction = get_singlish_instruction(case_data.singlish_level)
+
+    return f"""You are a standardized patient in an OSCE (Objective Structured Clinical Examination) simulation for medical students.
 
 CHARACTER PROFILE:
-- Name: {case_data.get('patient_name', 'Patient')}
-- Age: {case_data.get('age', 'Unknown')} years old
-- Gender: {case_data.get('gender', 'Unknown')}
-- Chief Complaint: {case_data.get('chief_complaint', 'Not specified')}
+- Name: {case_data.patient_name}
+- Age: {case_data.age} years old
+- Gender: {case_data.gender}
+- Chief Complaint: {case_data.chief_complaint}
 
 PRESENTING HISTORY:
-{case_data.get('presenting_history', 'Not provided')}
+{case_data.presenting_history}
 
 PAST MEDICAL HISTORY:
-{chr(10).join(case_data.get('past_medical_history', ['Not provided']))}
+{case_data.pmh_joined}
 
 SOCIAL HISTORY:
-{case_data.get('social_history', 'Not provided')}
+{case_data.social_history}
 
 ALLERGIES:
-{case_data.get('allergies', 'No known allergies')}
+{case_data.allergies}
 
 ACTING INSTRUCTIONS:
-{case_data.get('script_instructions', 'Act as a cooperative patient.')}
+{case_data.script_instructions}
 
 SECRET INFORMATION (only reveal if directly asked relevant questions):
-{case_data.get('secret_info', 'None')}
+{case_data.secret_info}
 
 LANGUAGE STYLE:
 {singlish_instruction}
@@ -259,20 +419,114 @@ IMPORTANT RULES:
 7. Keep responses concise (1-3 sentences usually) unless the question requires more detail
 8. If the student asks something inappropriate or off-topic, redirect politely as a patient would"""
 
-        response = client.chat.completions.create(
+
+# Fallback cap on history sent to the model if summarization fails
+_MAX_HISTORY_MESSAGES = 40
+
+# Keep this many recent messages verbatim; older turns get summarized
+_HISTORY_KEEP = 12
+
+
+@st.cache_data(show_spinner=False)
+def summarize_history(prefix_hash, prefix_text):
+    """Summarize older conversation turns into a short rolling recap.
+
+    Cached on a hash of the prefix, so each stretch of history is
+    summarized at most once rather than on every turn.
+    """
+    try:
+        client = get_openai_client()
+        response = run_async(client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": system_prompt},
-                *messages
+                {"role": "system", "content": "Summarize this OSCE patient interview so far in under 120 words. Keep every clinical fact the patient has revealed and note what the student has already asked."},
+                {"role": "user", "content": prefix_text},
             ],
-            max_tokens=300,
-            temperature=0.7
-        )
-        
+            max_tokens=180,
+            temperature=0.0
+        ))
         return response.choices[0].message.content
-    
+    except Exception:
+        return None
+
+
+def trim_history(messages):
+    """Compress history: a rolling summary of old turns plus recent ones verbatim.
+
+    The cut point advances in steps of _HISTORY_KEEP messages so the
+    summarized prefix stays stable (and cached) for many turns at a time.
+    """
+    cut = len(messages) - _HISTORY_KEEP
+    cut -= cut % _HISTORY_KEEP
+    if cut <= 0:
+        return messages
+
+    older, recent = messages[:cut], messages[cut:]
+    prefix_text = "\n".join(f"{m['role']}: {m['content']}" for m in older)
+    summary = summarize_history(hashlib.sha256(prefix_text.encode()).hexdigest(), prefix_text)
+    if summary is None:
+        return messages[-_MAX_HISTORY_MESSAGES:]
+
+    return [
+        {"role": "system", "content": f"Summary of the conversation so far:\n{summary}"},
+        *recent
+    ]
+
+
+# Reply token budget for short conversational acks vs substantive questions
+_ACK_MAX_TOKENS = 60
+_FULL_MAX_TOKENS = 300
+
+
+def is_short_ack(text):
+    """Heuristic: a short message with no question mark is conversational filler."""
+    return len(text.split()) < 8 and "?" not in text
+
+
+def get_ai_response(messages, system_prompt):
+    """Stream the AI response from OpenAI, yielding text chunks.
+
+    The system message is kept verbatim as the first element every turn,
+    so OpenAI's automatic prompt caching can reuse the shared prefix
+    across consecutive requests in a session.
+    """
+    try:
+        client = get_openai_client()
+        loop = get_event_loop()
+
+        # Short acks ("okay", "I see") don't need the full reply budget
+        last_user = messages[-1]["content"] if messages else ""
+        max_tokens = _ACK_MAX_TOKENS if is_short_ack(last_user) else _FULL_MAX_TOKENS
+
+        stream = run_async(client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                *trim_history(messages)
+            ],
+            max_tokens=max_tokens,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True}
+        ))
+
+        # Bridge the async stream to the sync generator st.write_stream expects
+        stream_iter = stream.__aiter__()
+        while True:
+            try:
+                chunk = asyncio.run_coroutine_threadsafe(stream_iter.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage is not None:
+                # Cached prefix tokens for the last turn; lets us verify
+                # prompt-cache hits without extra API calls
+                details = getattr(chunk.usage, "prompt_tokens_details", None)
+                st.session_state["_last_cached_tokens"] = getattr(details, "cached_tokens", 0)
+
     except Exception as e:
-        return f"I'm sorry, I'm having trouble responding right now. (Error: {str(e)})"
+        yield f"I'm sorry, I'm having trouble responding right now. (Error: {str(e)})"
 
 
 def home_page():
@@ -315,13 +569,48 @@ def home_page():
     """)
 
 
+@st.fragment
+def chat_panel(system_prompt):
+    """Chat history and input for the current case.
+
+    Runs as a fragment: submitting a message reruns only this block, so
+    the case selector, patient details and the rest of the page are not
+    re-rendered on every chat turn.
+    """
+    # Display chat messages
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"], avatar="👨‍⚕️" if message["role"] == "user" else "🤒"):
+            st.markdown(message["content"])
+
+    # Welcome message if no messages yet
+    if not st.session_state.messages:
+        st.info("Start by greeting the patient or asking about their complaint. Try: 'Hello, I'm the medical student. What brings you in today?'")
+
+    # Chat input
+    if prompt := st.chat_input("Type your question to the patient..."):
+        # Add user message
+        st.session_state.messages.append({"role": "user", "content": prompt})
+
+        with st.chat_message("user", avatar="👨‍⚕️"):
+            st.markdown(prompt)
+
+        # Stream AI response token by token; messages already hold only
+        # role/content keys, so no per-turn copy is needed
+        with st.chat_message("assistant", avatar="🤒"):
+            response = st.write_stream(get_ai_response(st.session_state.messages, system_prompt))
+
+        # Add assistant message
+        st.session_state.messages.append({"role": "assistant", "content": response})
+
+
 def osce_page():
     """Render the OSCE simulator page."""
     st.markdown('<p class="page-header">OSCE Simulator</p>', unsafe_allow_html=True)
     st.markdown('<p class="page-subtitle">Practice your history-taking skills</p>', unsafe_allow_html=True)
     
-    # Load cases
-    cases = load_cases()
+    # Load cases (cached; invalidated when a case file changes)
+    cases_signature = get_cases_signature()
+    cases = load_cases(cases_signature)
     
     if not cases:
         st.warning("No cases found. Please add JSON case files to the 'cases' folder.")
@@ -330,9 +619,8 @@ def osce_page():
             st.rerun()
         return
     
-    # Case selector
-    case_names = {case_id: f"{data.get('patient_name', 'Unknown')} - {data.get('chief_complaint', 'Unknown')}" 
-                  for case_id, data in cases.items()}
+    # Case selector (labels cached with the same signature as the cases)
+    case_names = get_case_labels(cases_signature)
     
     selected_case_id = st.selectbox(
         "Select a Case",
@@ -341,23 +629,26 @@ def osce_page():
         key="case_selector"
     )
     
+    case_data = cases[selected_case_id]
+
     # Reset chat when case changes
     if "current_case_id" not in st.session_state or st.session_state.current_case_id != selected_case_id:
         st.session_state.current_case_id = selected_case_id
         st.session_state.messages = []
-    
-    case_data = cases[selected_case_id]
+
+    # Cached: a lookup on every turn after the first build for this case
+    system_prompt = build_system_prompt(selected_case_id, case_data)
     
     # Patient details in expander
     with st.expander("Show Patient Details", expanded=False):
-        st.markdown(f"**Patient:** {case_data.get('patient_name', 'Unknown')}")
-        st.markdown(f"**Age/Gender:** {case_data.get('age', 'Unknown')} years old, {case_data.get('gender', 'Unknown')}")
-        st.markdown(f"**Chief Complaint:** {case_data.get('chief_complaint', 'Not specified')}")
-        
+        st.markdown(f"**Patient:** {case_data.patient_name}")
+        st.markdown(f"**Age/Gender:** {case_data.age} years old, {case_data.gender}")
+        st.markdown(f"**Chief Complaint:** {case_data.chief_complaint}")
+
         st.markdown("---")
         st.markdown("**Vital Signs:**")
-        
-        vitals = case_data.get('vitals', {})
+
+        vitals = case_data.vitals
         if vitals:
             cols = st.columns(2)
             vital_items = list(vitals.items())
@@ -366,43 +657,17 @@ def osce_page():
                     label = key.replace("_", " ").title()
                     st.metric(label=label, value=value)
         
-        if case_data.get('allergies'):
-            st.markdown(f"**Allergies:** {case_data.get('allergies')}")
+        if case_data.allergies:
+            st.markdown(f"**Allergies:** {case_data.allergies}")
     
     st.markdown("---")
-    
+
     # Initialize messages in session state
     if "messages" not in st.session_state:
         st.session_state.messages = []
-    
-    # Display chat messages
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"], avatar="👨‍⚕️" if message["role"] == "user" else "🤒"):
-            st.markdown(message["content"])
-    
-    # Welcome message if no messages yet
-    if not st.session_state.messages:
-        st.info("Start by greeting the patient or asking about their complaint. Try: 'Hello, I'm the medical student. What brings you in today?'")
-    
-    # Chat input
-    if prompt := st.chat_input("Type your question to the patient..."):
-        # Add user message
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        
-        with st.chat_message("user", avatar="👨‍⚕️"):
-            st.markdown(prompt)
-        
-        # Get AI response
-        with st.chat_message("assistant", avatar="🤒"):
-            with st.spinner("Patient is thinking..."):
-                ai_messages = [{"role": m["role"], "content": m["content"]} 
-                              for m in st.session_state.messages]
-                response = get_ai_response(ai_messages, case_data)
-                st.markdown(response)
-        
-        # Add assistant message
-        st.session_state.messages.append({"role": "assistant", "content": response})
-    
+
+    chat_panel(system_prompt)
+
     # Action buttons
     st.markdown("---")
     col1, col2 = st.columns(2)
@@ -481,11 +746,22 @@ def feedback_page():
         st.rerun()
 
 
+# Page routing table; unknown pages fall back to home
+_PAGES = {
+    "home": home_page,
+    "osce": osce_page,
+    "feedback": feedback_page,
+}
+
+
 def main():
     """Main application entry point."""
     # Initialize session state
     if "current_page" not in st.session_state:
         st.session_state.current_page = "home"
+
+    # Opportunistically persist any feedback queued on a previous rerun
+    flush_feedback()
     
     # Sidebar navigation
     with st.sidebar:
@@ -508,14 +784,7 @@ def main():
         st.markdown("Practice OSCE with AI patients")
     
     # Route to appropriate page
-    if st.session_state.current_page == "home":
-        home_page()
-    elif st.session_state.current_page == "osce":
-        osce_page()
-    elif st.session_state.current_page == "feedback":
-        feedback_page()
-    else:
-        home_page()
+    _PAGES.get(st.session_state.current_page, home_page)()
 
 
 if __name__ == "__main__":